@@ -1,3 +1,3 @@
-from .config import config
+from .config import get_config
 
-__all__ = ['config']
+__all__ = ['get_config']
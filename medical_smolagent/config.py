@@ -1,42 +1,85 @@
+from functools import lru_cache
+from typing import Any, Dict, Optional
 from pydantic import Field
-from pydantic_settings import BaseSettings
-import os
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 
 # 加载 .env 文件
 load_dotenv()
 
 class AgentConfig(BaseSettings):
-    """智能体配置类"""
-    model_id: str = Field(default_factory=lambda: os.getenv("MODEL_ID", "ollama_chat/llama3"), description="LLM模型ID")
-    api_base: str = Field(default_factory=lambda: os.getenv("API_BASE", "http://localhost:11434"), description="LLM API地址")
-    api_key: str = Field(default_factory=lambda: os.getenv("API_KEY", "none"), description="LLM API密钥")
-    num_ctx: int = Field(default_factory=lambda: int(os.getenv("NUM_CTX", "8192")), description="上下文窗口大小")
+    """智能体配置类，各字段由 BaseSettings 从同名（不区分大小写）环境变量读取"""
+    # 空值（如 .env 中的 OLLAMA_NUM_GPU=）视为未设置，使用字段默认值
+    model_config = SettingsConfigDict(env_ignore_empty=True)
+    
+    model_id: str = Field(default="ollama_chat/llama3", description="LLM模型ID")
+    api_base: str = Field(default="http://localhost:11434", description="LLM API地址")
+    api_key: str = Field(default="none", description="LLM API密钥")
+    num_ctx: int = Field(default=8192, description="上下文窗口大小")
+    
+    # 推理后端：ollama（本地开发）或 vllm（OpenAI兼容接口，适合多用户并发）
+    model_backend: str = Field(
+        default="ollama",
+        description="推理后端 (ollama, vllm)"
+    )
+    
+    vllm_model: str = Field(
+        default="Qwen/Qwen2.5-7B-Instruct-AWQ",
+        description="vLLM服务加载的模型名（默认AWQ-Int4量化版本）"
+    )
+    
+    vllm_api_base: str = Field(
+        default="http://localhost:8000/v1",
+        description="vLLM OpenAI兼容接口地址"
+    )
+    
+    # Ollama 推理参数
+    ollama_keep_alive: str = Field(
+        default="24h",
+        description="模型在Ollama中保持加载的时长，避免空闲后重新加载"
+    )
+    
+    ollama_num_batch: int = Field(
+        default=512,
+        description="Ollama预填充批大小"
+    )
+    
+    ollama_num_gpu: Optional[int] = Field(
+        default=None,
+        description="加载到GPU的模型层数，未设置时由Ollama自动决定"
+    )
+    
+    web_agent_pool_size: int = Field(
+        default=4,
+        description="Web模式可同时处理的请求数（每个请求独占一个agent）"
+    )
     
     mcp_server_url: str = Field(
-        default_factory=lambda: os.getenv(
-            "MCP_SERVER_URL", 
-            "https://evalstate-hf-mcp-server.hf.space/mcp"
-        ), 
+        default="https://evalstate-hf-mcp-server.hf.space/mcp", 
         description="MCP服务器地址"
     )
     
     proxy_url: str = Field(
-        default_factory=lambda: os.getenv("PROXY_URL", ""), 
+        default="", 
         description="代理服务器地址"
     )
     
     # 翻译相关配置
     translation_api: str = Field(
-        default_factory=lambda: os.getenv("TRANSLATION_API", "qwen"), 
+        default="qwen", 
         description="翻译API提供商 (qwen, baidu)"
     )
     
     dashscope_api_key: str = Field(
-        default_factory=lambda: os.getenv("DASHSCOPE_API_KEY", ""),
+        default="",
         description="DashScope API密钥"
     )
     
+    lid_model_path: str = Field(
+        default="lid.176.ftz",
+        description="fastText语言识别模型路径（可选，缺失时使用字符集检测）"
+    )
+    
     # 支持的语言映射
     language_map: dict = Field(
         default_factory=lambda: {
@@ -51,5 +94,27 @@ class AgentConfig(BaseSettings):
         description="语言名称到代码的映射"
     )
 
-# 创建全局配置实例
-config = AgentConfig()
\ No newline at end of file
+    def ollama_model_kwargs(self, model_id: str) -> Dict[str, Any]:
+        """返回传给LiteLLM的Ollama额外参数，非Ollama模型返回空字典"""
+        if not model_id.startswith("ollama"):
+            return {}
+        kwargs: Dict[str, Any] = {
+            "keep_alive": self.ollama_keep_alive,
+            "num_batch": self.ollama_num_batch,
+        }
+        if self.ollama_num_gpu is not None:
+            kwargs["num_gpu"] = self.ollama_num_gpu
+        return kwargs
+
+    def vllm_model_kwargs(self) -> Dict[str, Any]:
+        """返回连接vLLM OpenAI兼容接口的LiteLLMModel参数"""
+        return {
+            "model_id": f"openai/{self.vllm_model}",
+            "api_base": self.vllm_api_base,
+            "api_key": "EMPTY",  # vLLM 不校验密钥，但需要提供非空值
+        }
+
+@lru_cache(maxsize=1)
+def get_config() -> AgentConfig:
+    """获取全局配置实例（首次调用时创建）"""
+    return AgentConfig()
\ No newline at end of file
@@ -1,21 +1,41 @@
 import os
+import re
 import sys
+import atexit
 import argparse
-import gradio as gr
-from typing import List, Dict, Any, Optional, Union, Tuple
+import threading
+import queue
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import cache
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Union, Tuple
 from loguru import logger
 
-from smolagents import ToolCollection, CodeAgent, LiteLLMModel, GradioUI
-from medical_smolagent.tools.translation import translate, TranslationTool
+from smolagents import ToolCollection, CodeAgent, LiteLLMModel, ChatMessageStreamDelta, FinalAnswerStep
+from medical_smolagent import get_config
 
-# 配置本地 Ollama 模型
-model = LiteLLMModel(
-    model_id="ollama/qwen3:8b",  # 添加 ollama/ 前缀指定提供者
-    api_base="http://localhost:11434",  # Ollama 默认地址
-    api_key="ollama",  # Ollama 不需要密钥，但需要提供非空值
-    num_ctx=8192,  # 上下文长度
-    timeout=120,    # 增加超时时间
-)
+# 中文字符检测（C层扫描，避免逐字符的Python循环）
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+
+if get_config().model_backend == "vllm":
+    # 多用户部署：连接 vLLM 的 OpenAI 兼容接口（连续批处理，并发吞吐更高）
+    model = LiteLLMModel(
+        **get_config().vllm_model_kwargs(),
+        timeout=120,
+    )
+else:
+    # 配置本地 Ollama 模型
+    # 使用 ollama_chat/ 前缀（/api/chat）：LiteLLM 只在该接口把 keep_alive 放在请求顶层，
+    # ollama/ 前缀（/api/generate）会把它塞进 options，Ollama 不认，模型仍会在5分钟后卸载
+    MODEL_ID = "ollama_chat/qwen3:8b"
+    model = LiteLLMModel(
+        model_id=MODEL_ID,
+        api_base="http://localhost:11434",  # Ollama 默认地址
+        api_key="ollama",  # Ollama 不需要密钥，但需要提供非空值
+        num_ctx=8192,  # 上下文长度
+        timeout=120,    # 增加超时时间
+        **get_config().ollama_model_kwargs(MODEL_ID),  # keep_alive/num_batch，避免空闲后重新加载模型
+    )
 
 # 配置Streamable HTTP MCP服务器参数
 server_parameters = {
@@ -29,11 +49,41 @@ def setup_logging():
     logger.add(
         sys.stderr,
         format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-        level="INFO"
+        level="INFO",
+        enqueue=True  # 日志写入在后台线程完成，不阻塞请求处理
     )
 
-def translate_response(response: Union[str, Dict, Any]) -> str:
-    """将响应翻译成中文"""
+def warmup_model() -> None:
+    """发送一个1 token的请求，让模型在第一个真实查询之前完成加载"""
+    try:
+        model.generate([{"role": "user", "content": [{"type": "text", "text": "hi"}]}], max_tokens=1)
+        logger.info("Model warmup finished")
+    except Exception as e:
+        logger.warning("Model warmup failed: {}", e)
+
+@cache
+def _get_translator():
+    """延迟导入并初始化翻译工具，只在第一次需要翻译时付出导入开销"""
+    from medical_smolagent.tools.translation import translator
+    translator.initialize()
+    return translator
+
+def translate_response(response: Union[str, List[str], Dict, Any]) -> str:
+    """将响应翻译成中文，多段结果合并为一次批量翻译"""
+    if isinstance(response, list):
+        # 规划器返回的每段首行是“[工具 结果]”标题，只翻译标题下的正文
+        segments = [str(segment).partition("\n") for segment in response]
+        bodies = [body for _, _, body in segments]
+        try:
+            bodies = _get_translator().translate_batch(bodies, target_lang="Chinese")
+        except Exception as e:
+            logger.error(f"Error in translate_response: {str(e)}", exc_info=True)
+            text = "\n\n".join(str(segment) for segment in response)
+            return f"{text}\n\n(翻译失败: {str(e)})"
+        return "\n\n".join(
+            f"{header}{sep}{body}" for (header, sep, _), body in zip(segments, bodies)
+        )
+    
     if isinstance(response, dict):
         text = response.get('text', str(response))
     else:
@@ -42,17 +92,19 @@ def translate_response(response: Union[str, Dict, Any]) -> str:
     if not text.strip():
         return text
         
-    # 检测语言
-    from medical_smolagent.tools.translation import LanguageDetector
-    detected_lang = LanguageDetector.detect_language(text)
-    logger.info(f"Detected language: {detected_lang}")
+    # 检测语言：纯ASCII文本不含任何CJK字符，无需调用检测器
+    if text.isascii():
+        detected_lang = "English"
+    else:
+        from medical_smolagent.tools.translation import LanguageDetector
+        detected_lang = LanguageDetector.detect_language(text)
+    logger.info("Detected language: {}", detected_lang)
     
     # 如果不是中文，则翻译
     if detected_lang != "Chinese":
-        logger.info(f"Translating from {detected_lang} to Chinese")
+        logger.info("Translating from {} to Chinese", detected_lang)
         try:
-            from medical_smolagent.tools.translation import translator
-            translated = translator.translate(text, source_lang=detected_lang, target_lang="Chinese")
+            translated = _get_translator().translate(text, source_lang=detected_lang, target_lang="Chinese")
             return translated
         except Exception as e:
             logger.error(f"Error in translate_response: {str(e)}", exc_info=True)
@@ -60,60 +112,117 @@ def translate_response(response: Union[str, Dict, Any]) -> str:
             
     return text
 
-# 全局变量，用于保持MCP连接
-_global_tool_collection = None
-_global_tools = []  # 初始化为空列表
+def _find_tools(tools: Iterable[Any], needed_tools: Optional[Set[str]]) -> List[Any]:
+    """筛选所需的工具，全部找到后即停止遍历；needed_tools为None时返回全部工具"""
+    if needed_tools is None:
+        return list(tools)
+    remaining = set(needed_tools)
+    found = []
+    for tool in tools:
+        if tool.name in remaining:
+            found.append(tool)
+            remaining.discard(tool.name)
+            if not remaining:
+                break
+    return found
+
+class MCPSessionManager:
+    """MCP会话管理器，进程内只建立一次MCP连接并缓存工具信息"""
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, server_parameters: Dict[str, Any]):
+        if self._initialized:
+            return
+        self.server_parameters = server_parameters
+        self.server_sessions: Dict[str, Any] = {}  # 服务器地址 -> 已进入的ToolCollection上下文
+        self.server_descriptions: Dict[str, str] = {}  # 工具名 -> 工具描述
+        self.tools: List[Any] = []
+        self.needed_tools: Optional[Set[str]] = None  # 只加载这些工具，None表示全部
+        self._contexts: List[Any] = []
+        self._initialized = True
+
+    def __enter__(self) -> "MCPSessionManager":
+        server_name = self.server_parameters["url"]
+        if server_name in self.server_sessions:
+            return self  # 已经连接
+
+        logger.info("Initializing MCP tool collection...")
+        logger.debug(f"Using server parameters: {self.server_parameters}")
+
+        context = ToolCollection.from_mcp(self.server_parameters, trust_remote_code=True)
+        tool_collection = context.__enter__()
+        self._contexts.append(context)
+        self.server_sessions[server_name] = tool_collection
+
+        self.tools = _find_tools(tool_collection.tools, self.needed_tools)
+        self.server_descriptions = {tool.name: tool.description for tool in self.tools}
+
+        # 进程退出时关闭MCP连接
+        atexit.register(self.__exit__, None, None, None)
+        logger.info(f"MCP tool collection initialized successfully with {len(self.tools)} tools")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        while self._contexts:
+            context = self._contexts.pop()
+            try:
+                context.__exit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Failed to close MCP session: {str(e)}")
+        self.server_sessions.clear()
+
+@dataclass
+class AgentResponse:
+    """agent的响应，text 为已转换为字符串并翻译好的最终回答"""
+    text: str
+    
+    def __str__(self) -> str:
+        return self.text
+
+# 全局MCP会话管理器，用于保持MCP连接
+_mcp_manager = MCPSessionManager(server_parameters)
 
-def initialize_mcp_tools() -> bool:
-    """初始化MCP工具集合"""
-    global _global_tool_collection, _global_tools
+# 缓存的agent及其对应的工具列表签名
+_global_agent: Optional[CodeAgent] = None
+_global_agent_key: Optional[int] = None
+
+def initialize_mcp_tools(needed_tools: Optional[Set[str]] = None) -> bool:
+    """
+    初始化MCP工具集合
     
-    if _global_tool_collection is not None:
-        return True  # 已经初始化
-        
+    Args:
+        needed_tools: 只加载这些名称的工具（首次连接时生效），为None时加载全部工具
+    """
     try:
-        logger.info("Initializing MCP tool collection...")
-        logger.debug(f"Using server parameters: {server_parameters}")
-        
-        # 创建工具集合
-        _global_tool_collection = ToolCollection.from_mcp(
-            server_parameters, 
-            trust_remote_code=True
-        )
-        
-        # 进入上下文
-        context = _global_tool_collection.__enter__()
-        logger.debug(f"MCP context entered: {context}")
-        
-        # 获取工具列表
-        if hasattr(_global_tool_collection, 'tools'):
-            _global_tools = list(_global_tool_collection.tools)  # 转换为列表并保存
-            logger.info(f"MCP tool collection initialized successfully with {len(_global_tools)} tools")
-            return True
-        else:
-            logger.error("MCP tool collection has no 'tools' attribute")
-            return False
-            
+        if needed_tools is not None:
+            _mcp_manager.needed_tools = set(needed_tools)
+        _mcp_manager.__enter__()
+        return True
     except Exception as e:
         logger.error(f"Failed to initialize MCP tool collection: {str(e)}", exc_info=True)
-        _global_tools = []
         return False
 
-def get_agent() -> CodeAgent:
-    """获取配置好的agent实例，并添加翻译功能"""
-    # 确保翻译工具已初始化
-    from medical_smolagent.tools.translation import translator
-    translator.initialize()
-    
-    # 初始化MCP工具
-    initialize_mcp_tools()
-    
-    # 创建原始agent
-    agent = CodeAgent(
-        tools=_global_tools,  # 使用缓存的工具列表
-        add_base_tools=True,
-        model=model
-    )
+def _translate_text(text: str) -> str:
+    """翻译文本为中文"""
+    if not text or _CJK_RE.search(text) is not None:
+        return text
+    try:
+        # 翻译工具内部按内容哈希缓存结果，重复的响应不会再次请求翻译API
+        return _get_translator().translate(text, target_lang="Chinese")
+    except Exception as e:
+        logger.error(f"翻译响应时出错: {str(e)}")
+        return f"{text}\n\n(翻译失败: {str(e)})"
+
+def _add_translation(agent: CodeAgent) -> CodeAgent:
+    """为agent的run和final_answer添加翻译功能，重复调用不会重复包装"""
+    if getattr(agent, "_translation_patched", False):
+        return agent
     
     # 保存原始的run方法
     original_run = agent.run
@@ -121,21 +230,10 @@ def get_agent() -> CodeAgent:
     # 保存原始的final_answer函数
     original_final_answer = getattr(agent, 'final_answer', None)
     
-    # 定义翻译函数
-    def translate_text(text: str) -> str:
-        """翻译文本为中文"""
-        if not text or any('\u4e00' <= char <= '\u9fff' for char in text):
-            return text
-        try:
-            return translator.translate(text, target_lang="Chinese")
-        except Exception as e:
-            logger.error(f"翻译响应时出错: {str(e)}")
-            return f"{text}\n\n(翻译失败: {str(e)})"
-    
     # 重写final_answer方法
     def final_answer_with_translation(answer: str) -> str:
         """包装final_answer，添加翻译功能"""
-        translated = translate_text(answer)
+        translated = _translate_text(answer)
         if original_final_answer:
             return original_final_answer(translated)
         return translated
@@ -145,28 +243,113 @@ def get_agent() -> CodeAgent:
         agent.final_answer = final_answer_with_translation
     
     # 重写run方法，添加翻译功能
-    def run_with_translation(query: str, *args, **kwargs) -> str:
+    def run_with_translation(query: str, *args, **kwargs) -> AgentResponse:
         try:
             # 调用原始的run方法
             response = original_run(query, *args, **kwargs)
             
-            # 确保响应是字符串
-            if not isinstance(response, str):
-                response = str(response)
+            # 只在这里转换一次为字符串，调用方直接使用 AgentResponse.text
+            text = response if isinstance(response, str) else f"{response!s}"
             
             # 如果响应不是中文，尝试翻译
-            return translate_text(response)
+            return AgentResponse(text=_translate_text(text))
             
         except Exception as e:
             error_msg = f"执行查询时出错: {str(e)}"
             logger.error(error_msg)
-            return error_msg
+            return AgentResponse(text=error_msg)
+    
+    # 流式执行：逐段产出模型生成的文本，最后产出翻译后的 AgentResponse
+    def run_stream_with_translation(query: str, *args, **kwargs) -> Iterator[Union[str, AgentResponse]]:
+        final_output: Any = None
+        try:
+            for event in original_run(query, *args, stream=True, **kwargs):
+                if isinstance(event, ChatMessageStreamDelta):
+                    if event.content:
+                        yield event.content
+                elif isinstance(event, FinalAnswerStep):
+                    final_output = event.output
+        except Exception as e:
+            error_msg = f"执行查询时出错: {str(e)}"
+            logger.error(error_msg)
+            yield AgentResponse(text=error_msg)
+            return
+        
+        text = final_output if isinstance(final_output, str) else f"{final_output!s}"
+        yield AgentResponse(text=_translate_text(text))
     
     # 替换run方法
     agent.run = run_with_translation
+    agent.run_stream = run_stream_with_translation
+    agent._translation_patched = True
     
     return agent
 
+def _current_tools() -> Tuple[List[Any], int]:
+    """初始化MCP工具（失败后会在下次调用时重试），返回工具列表及其签名"""
+    initialize_mcp_tools()
+    tools = _mcp_manager.tools
+    return tools, hash(tuple(tool.name for tool in tools))
+
+def _build_agent(tools: List[Any]) -> CodeAgent:
+    """创建agent并添加翻译功能"""
+    return _add_translation(CodeAgent(
+        tools=tools,  # 使用缓存的工具列表
+        add_base_tools=True,
+        model=model,
+        stream_outputs=True  # 模型输出逐token返回，供 run_stream 实时显示
+    ))
+
+def get_agent() -> CodeAgent:
+    """获取配置好的agent实例，并添加翻译功能"""
+    global _global_agent, _global_agent_key
+    
+    # 工具列表未变化时复用已构建的agent
+    tools, agent_key = _current_tools()
+    if _global_agent is not None and _global_agent_key == agent_key:
+        return _global_agent
+    
+    _global_agent = _build_agent(tools)
+    _global_agent_key = agent_key
+    return _global_agent
+
+class AgentPool:
+    """
+    Web模式的agent池
+    
+    agent.run 会重置agent的记忆，多个请求不能共用一个agent。池中预先构建
+    size 个agent，每个请求独占一个，最多 size 个请求并发执行；工具列表变化
+    （如MCP连接恢复）时整池重建，归还的旧agent直接丢弃。
+    """
+    
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+        self._agents: "queue.Queue[CodeAgent]" = queue.Queue()
+        self._key: Optional[int] = None
+        self._refresh()
+    
+    def _refresh(self) -> "queue.Queue[CodeAgent]":
+        """工具列表变化时重建整个池，返回当前的agent队列"""
+        tools, key = _current_tools()
+        with self._lock:
+            if key != self._key:
+                agents: "queue.Queue[CodeAgent]" = queue.Queue()
+                for _ in range(self.size):
+                    agents.put(_build_agent(tools))
+                self._agents, self._key = agents, key
+            return self._agents
+    
+    @contextmanager
+    def checkout(self) -> Iterator[CodeAgent]:
+        """取出一个空闲agent供本次请求独占使用，池中没有空闲agent时等待"""
+        agents = self._refresh()
+        agent = agents.get()
+        try:
+            yield agent
+        finally:
+            agents.put(agent)
+
 def run_cli():
     """运行命令行界面"""
     print("\n医疗智能体初始化完成！")
@@ -183,35 +366,40 @@ def run_cli():
             if not query:
                 continue
             
-            print(f"\n处理中，请稍候...")
+            logger.info("处理查询: {}", query)
             
             try:
-                # 获取新的agent实例处理查询
+                # 获取缓存的agent实例处理查询，模型输出边生成边打印
                 agent = get_agent()
-                response = agent.run(query)
-                
-                # 确保响应是字符串
-                if not isinstance(response, str):
-                    response = str(response)
+                response = ""
+                for chunk in agent.run_stream(query):
+                    if isinstance(chunk, AgentResponse):
+                        response = chunk.text
+                    else:
+                        print(chunk, end="", flush=True)
                 
-                print(f"\n{'='*80}")
-                print(f"问题: {query}")
-                print("-"*80)
-                print(f"回答: {response}")
-                print("="*80)
+                print(f"\n{'='*80}\n问题: {query}\n{'-'*80}\n回答: {response}\n{'='*80}")
                 
             except Exception as e:
-                error_msg = f"处理查询时出错: {str(e)}"
-                print(f"\n{error_msg}")
-                logger.error(error_msg)
+                logger.error("处理查询时出错: {}", e)
+                print(f"\n处理查询时出错: {str(e)}")
             
         except KeyboardInterrupt:
             print("\n检测到中断信号，正在退出...")
             break
 
+# Web模式每次请求随问题附带的最近对话轮数
+_MAX_HISTORY_TURNS = 5
+
 def run_gradio():
     """运行Gradio Web界面"""
+    # 只有Web模式才导入gradio，命令行模式不付出其导入开销
+    import gradio as gr
+    
     try:
+        # 启动时预先构建agent池：每个请求独占一个agent，多个会话可并发执行
+        agent_pool = AgentPool(get_config().web_agent_pool_size)
+        
         # 创建Gradio界面
         with gr.Blocks(title="医疗智能体") as demo:
             gr.Markdown("# 医疗智能体")
@@ -231,39 +419,42 @@ def run_gradio():
                 submit_btn = gr.Button("提交")
                 clear_btn = gr.Button("清空对话")
             
-            def respond(message: str, chat_history: List[Tuple[str, str]] = None) -> Tuple[str, List[Tuple[str, str]]]:
-                """处理用户输入并返回响应"""
+            def respond(message: str, chat_history: List[Tuple[str, str]] = None) -> Iterator[Tuple[str, List[Tuple[str, str]]]]:
+                """处理用户输入：先显示用户消息，再实时显示模型输出，最后替换为翻译后的回答"""
                 if chat_history is None:
                     chat_history = []
+                
+                # 先显示用户消息，不必等待agent完成
+                chat_history.append((message, None))
+                yield "", chat_history
                     
                 try:
-                    # 显示用户消息
-                    chat_history.append((message, None))
-                    
-                    # 获取新的agent实例处理查询
-                    agent = get_agent()
-                    
-                    # 处理查询并获取响应
-                    response = agent.run(message)
-                    
-                    # 确保响应是字符串
-                    if not isinstance(response, str):
-                        response = str(response)
-                    
-                    # 更新聊天历史
-                    chat_history[-1] = (message, response)
-                    
-                    return "", chat_history
+                    # 取出一个空闲agent处理查询；agent.run 会重置记忆，
+                    # 本会话之前的对话通过 additional_args 显式传入
+                    history = chat_history[:-1][-_MAX_HISTORY_TURNS:]
+                    with agent_pool.checkout() as agent:
+                        partial = ""
+                        for chunk in agent.run_stream(
+                            message,
+                            additional_args={"chat_history": history} if history else None
+                        ):
+                            if isinstance(chunk, AgentResponse):
+                                # 更新聊天历史为最终回答
+                                chat_history[-1] = (message, chunk.text)
+                            else:
+                                partial += chunk
+                                chat_history[-1] = (message, partial)
+                                yield "", chat_history
                     
                 except Exception as e:
-                    error_msg = f"处理请求时出错: {str(e)}"
-                    logger.error(error_msg)
-                    chat_history[-1] = (message, error_msg)
-                    return "", chat_history
+                    logger.error("处理请求时出错: {}", e)
+                    chat_history[-1] = (message, f"处理请求时出错: {str(e)}")
+                
+                yield "", chat_history
             
             # 设置事件处理
-            msg.submit(respond, [msg, chatbot], [msg, chatbot])
-            submit_btn.click(respond, [msg, chatbot], [msg, chatbot])
+            msg.submit(respond, [msg, chatbot], [msg, chatbot], concurrency_limit=agent_pool.size)
+            submit_btn.click(respond, [msg, chatbot], [msg, chatbot], concurrency_limit=agent_pool.size)
             clear_btn.click(lambda: [], None, chatbot, queue=False)
             
             # 添加自定义CSS
@@ -306,6 +497,9 @@ def main():
     
     args = parser.parse_args()
     
+    # 后台预热模型，与用户输入第一个问题的时间重叠
+    threading.Thread(target=warmup_model, name="model-warmup", daemon=True).start()
+    
     try:
         if args.mode == 'web':
             print("\n=== 医疗智能体 Web 界面 ===")
@@ -1,16 +1,22 @@
 from smolagents import LiteLLMModel
 from loguru import logger
-from medical_smolagent.config import config
+from medical_smolagent.config import get_config
 
 class ModelProvider:
     """模型服务提供者，封装模型调用逻辑"""
     def __init__(self):
-        self.model = LiteLLMModel(
-            model_id=config.model_id,
-            api_base=config.api_base,
-            api_key=config.api_key,
-            num_ctx=config.num_ctx
-        )
+        config = get_config()
+        if config.model_backend == "vllm":
+            self.model_kwargs = config.vllm_model_kwargs()
+        else:
+            self.model_kwargs = {
+                "model_id": config.model_id,
+                "api_base": config.api_base,
+                "api_key": config.api_key,
+                "num_ctx": config.num_ctx,
+                **config.ollama_model_kwargs(config.model_id)
+            }
+        self.model = LiteLLMModel(**self.model_kwargs)
     
     def generate(self, prompt: str) -> str:
         """生成回答"""
@@ -23,4 +29,4 @@ class ModelProvider:
             return str(response)
         except Exception as e:
             logger.error(f"模型调用失败: {e}")
-            return f"模型错误: {str(e)}"
\ No newline at end of file
+            return f"模型错误: {str(e)}"
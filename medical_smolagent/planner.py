@@ -1,6 +1,22 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from smolagents import Tool
 from loguru import logger
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence, Tuple
+
+# 同时执行的工具调用数上限
+MAX_CONCURRENT_TOOLS = 4
+
+# 调用方已处于事件循环中（如Gradio异步处理函数）时，在这些线程里运行规划的事件循环
+_loop_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TOOLS, thread_name_prefix="planner-loop")
+
+async def _forward_async(tool: Tool, query: str, executor: ThreadPoolExecutor) -> str:
+    """异步调用工具，工具未提供原生异步接口时放到线程池中执行"""
+    aforward = getattr(tool, "aforward", None)
+    if aforward is not None and asyncio.iscoroutinefunction(aforward):
+        return await aforward(query)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, tool.forward, query)
 
 class MedicalToolPlanner:
     """医疗工具规划器，决定使用哪些工具和调用顺序"""
@@ -15,55 +31,108 @@ class MedicalToolPlanner:
             "WikipediaSearch",
             "DuckDuckGoSearch"
         ]
+        
+        # 预先计算各分组对应的工具（不可变元组，各次查询共享）
+        self._calc_tools = self._pick_tools(("MedicalMCP",))
+        self._def_tools = self._pick_tools(("WikipediaSearch",))
+        self._default_tools = self._pick_tools(self.priority_order)
     
-    def select_tools(self, query: str) -> List[Tool]:
+    def _pick_tools(self, names) -> Tuple[Tool, ...]:
+        """按名称顺序取出已注册的工具"""
+        return tuple(self.tool_map[name] for name in names if name in self.tool_map)
+    
+    def select_tools(self, query: str) -> Tuple[Tool, ...]:
         """根据查询内容选择合适的工具"""
         self.logger.info(f"为查询选择工具: {query}")
         
         # 简化逻辑：根据查询关键词选择工具
         if "计算" in query or "分析" in query:
-            return [self.tool_map.get("MedicalMCP")]
+            return self._calc_tools
         
         if "指南" in query or "定义" in query:
-            return [self.tool_map.get("WikipediaSearch")]
+            return self._def_tools
         
         # 默认使用所有工具
-        return [self.tool_map.get(name) for name in self.priority_order 
-                if name in self.tool_map]
+        return self._default_tools
+    
+    def execute_plan(self, query: str, tools: Sequence[Tool]) -> List[str]:
+        """执行工具调用计划（同步入口，可在事件循环内调用）"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aexecute_plan(query, tools))
+        # asyncio.run 不能在运行中的事件循环里调用，改到独立线程中执行
+        return _loop_executor.submit(asyncio.run, self.aexecute_plan(query, tools)).result()
     
-    def execute_plan(self, query: str, tools: List[Tool]) -> str:
-        """执行工具调用计划"""
-        results = []
+    async def aexecute_plan(self, query: str, tools: Sequence[Tool]) -> List[str]:
+        """
+        并发执行工具调用计划
+        
+        各工具同时执行，但结果与按优先级顺序逐个调用一致：只有当某个工具的结果
+        足够充分、且排在它前面的工具都已完成（结果不充分或调用失败）时才提前返回，
+        返回的结果不会因为低优先级工具更快而丢弃高优先级工具的结果。
+        """
+        tools = [tool for tool in tools if tool]
+        sem = asyncio.Semaphore(MAX_CONCURRENT_TOOLS)
+        # 每个计划使用独立线程池：提前返回后被放弃的慢调用只占用本计划的线程，
+        # 不会拖慢后续计划（asyncio.run 退出时也不等待这些线程）
+        executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TOOLS, thread_name_prefix="planner-tool")
+        
+        async def _bounded(index: int, tool: Tool):
+            async with sem:
+                self.logger.info(f"调用工具: {tool.name}")
+                try:
+                    return index, await _forward_async(tool, query, executor)
+                except Exception as e:
+                    self.logger.error(f"工具调用失败: {e}")
+                    return index, None
         
-        for tool in tools:
-            if not tool:
-                continue
+        tasks = [asyncio.create_task(_bounded(i, tool)) for i, tool in enumerate(tools)]
+        finished: Dict[int, Optional[str]] = {}  # 工具序号 -> 结果，调用失败为None
+        
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, result = await next_done
+                finished[index] = result
                 
-            self.logger.info(f"调用工具: {tool.name}")
-            result = tool.forward(query)
-            results.append({
-                "tool": tool.name,
-                "result": result
-            })
-            
-            # 如果结果足够充分，可以提前返回
-            if self._is_adequate(result):
-                break
+                # 按优先级检查已连续完成的前缀，遇到充分结果即可提前返回
+                if self._adequate_prefix(finished, len(tools)) is not None:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
         
-        return self._combine_results(results)
+        last = self._adequate_prefix(finished, len(tools))
+        if last is None:
+            last = len(tools) - 1
+        
+        # 按工具优先级顺序组合结果
+        return self._combine_results([
+            {"tool": tools[i].name, "result": finished[i]}
+            for i in range(last + 1)
+            if finished.get(i) is not None
+        ])
+    
+    def _adequate_prefix(self, finished: Dict[int, Optional[str]], count: int) -> Optional[int]:
+        """返回优先级最高的充分结果的序号；其前面有工具未完成或没有充分结果时返回None"""
+        for i in range(count):
+            if i not in finished:
+                return None
+            if finished[i] is not None and self._is_adequate(finished[i]):
+                return i
+        return None
     
     def _is_adequate(self, result: str) -> bool:
         """判断结果是否足够充分"""
         return not any(keyword in result for keyword in ["未找到相关", "错误", "不可用"])
     
-    def _combine_results(self, results: List[Dict]) -> str:
-        """组合多个工具的结果"""
+    def _combine_results(self, results: List[Dict]) -> List[str]:
+        """组合多个工具的结果，每个工具一段，便于批量翻译"""
         if not results:
-            return "未找到相关信息"
+            return ["未找到相关信息"]
             
-        combined = "\n\n".join([
+        return [
             f"[{item['tool']} 结果]\n{item['result']}"
             for item in results
-        ])
-        
-        return combined
\ No newline at end of file
+        ]
@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from functools import lru_cache
+import json
 import os
 import urllib3
 from smolagents import Tool
@@ -6,7 +8,7 @@ from loguru import logger
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from medical_smolagent import config
+from medical_smolagent import get_config
 
 class BaseTool(Tool, ABC):
     """工具基类，封装通用逻辑"""
@@ -31,34 +33,48 @@ class BaseTool(Tool, ABC):
         """执行工具逻辑"""
         pass
 
+# 优先使用orjson解析响应JSON（可选依赖），未安装时回退到标准库
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# 禁用SSL验证警告（进程内只需设置一次）
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# 设置代理环境变量，确保子进程也能使用代理
+_proxy_url = get_config().proxy_url
+if _proxy_url:
+    os.environ['http_proxy'] = _proxy_url
+    os.environ['https_proxy'] = _proxy_url
+    os.environ['HTTP_PROXY'] = _proxy_url
+    os.environ['HTTPS_PROXY'] = _proxy_url
+
 class NetworkTool(BaseTool):
     """网络工具基类，处理代理和重试"""
     def __init__(self, name: str, description: str):
         super().__init__(name, description)
-        self.session = self._create_session()
+        self.session = self._get_session(get_config().proxy_url)
     
-    def _create_session(self):
-        """创建带代理和重试机制的会话"""
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def _get_session(proxy_url: str) -> requests.Session:
+        """获取带代理和重试机制的共享会话，同一代理地址的所有工具复用一个连接池"""
         session = requests.Session()
         
         # 配置代理
-        if config.proxy_url:
+        if proxy_url:
             session.proxies = {
-                'http': config.proxy_url,
-                'https': config.proxy_url
+                'http': proxy_url,
+                'https': proxy_url
             }
-            
-            # 设置环境变量，确保子进程也能使用代理
-            os.environ['http_proxy'] = config.proxy_url
-            os.environ['https_proxy'] = config.proxy_url
-            os.environ['HTTP_PROXY'] = config.proxy_url
-            os.environ['HTTPS_PROXY'] = config.proxy_url
         
         # 配置重试
         retries = Retry(
             total=3,  # 总重试次数
             backoff_factor=1,  # 重试间隔因子
-            status_forcelist=[500, 502, 503, 504],  # 需要重试的HTTP状态码
+            status_forcelist=[429, 500, 502, 503, 504],  # 需要重试的HTTP状态码（429时遵循Retry-After）
             allowed_methods=["GET", "POST"],  # 允许重试的HTTP方法
             raise_on_status=False  # 不抛出状态码异常，由调用方处理
         )
@@ -66,14 +82,18 @@ class NetworkTool(BaseTool):
         # 为HTTP和HTTPS请求添加重试适配器
         adapter = HTTPAdapter(
             max_retries=retries,
-            pool_connections=10,  # 连接池大小
-            pool_maxsize=10,  # 最大连接数
+            pool_connections=32,  # 连接池大小，容纳规划器的并发调用
+            pool_maxsize=32,  # 最大连接数
             pool_block=False  # 非阻塞模式
         )
         
         session.mount('http://', adapter)
         session.mount('https://', adapter)
         
+        # 关闭SSL验证。注意：请求级 verify 为 None 时，requests 会用环境变量
+        # REQUESTS_CA_BUNDLE/CURL_CA_BUNDLE 覆盖会话设置，调用方需传入 verify=self.session.verify
+        session.verify = False
+        
         # 设置默认请求头
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -82,7 +102,9 @@ class NetworkTool(BaseTool):
             'Connection': 'keep-alive',
         })
         
-        # 禁用SSL验证警告
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        
-        return session
\ No newline at end of file
+        return session
+    
+    @staticmethod
+    def _parse_json(response: requests.Response):
+        """解析响应体JSON，解析失败时抛出 json.JSONDecodeError"""
+        return _json_loads(response.content)
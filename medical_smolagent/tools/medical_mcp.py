@@ -1,7 +1,15 @@
+import weakref
 from medical_smolagent.tools.base_tool import BaseTool
 from smolagents.mcp_client import MCPClient
 from loguru import logger
-from medical_smolagent import config
+from medical_smolagent import get_config
+
+def _find_tool(mcp_client, name: str):
+    """按名称查找MCP工具，找到即停止遍历"""
+    for tool in mcp_client:
+        if tool.name == name:
+            return tool
+    return None
 
 class MedicalMCPTool(BaseTool):
     """医疗领域MCP工具集成"""
@@ -10,40 +18,43 @@ class MedicalMCPTool(BaseTool):
             name="MedicalMCP",
             description="使用医疗专业计算和分析工具"
         )
-        self.mcp_tools = self._load_mcp_tools()
+        self._mcp_ctx = None
+        self._mcp_client = []
+        self._calculator_tool = None
+        self._load_mcp_tools()
     
     def _load_mcp_tools(self):
-        """加载MCP工具"""
+        """加载MCP工具，连接在工具生命周期内保持打开"""
         try:
             mcp_server_parameters = {
-                "url": config.mcp_server_url,
+                "url": get_config().mcp_server_url,
                 "transport": "streamable-http",
             }
-            with MCPClient(mcp_server_parameters) as mcp_client:
-                return mcp_client
+            self._mcp_ctx = MCPClient(mcp_server_parameters)
+            self._mcp_client = self._mcp_ctx.__enter__()
+            # 工具对象被回收时关闭MCP连接
+            weakref.finalize(self, self._mcp_ctx.__exit__, None, None, None)
+            # 只需要 medical_calculator，找到后即停止遍历
+            self._calculator_tool = _find_tool(self._mcp_client, "medical_calculator")
         except Exception as e:
             self.logger.error(f"加载MCP工具失败: {e}")
-            return []
+            self._mcp_client = []
+            self._calculator_tool = None
     
     def forward(self, query: str) -> str:
         self.logger.info(f"MCP查询: {query}")
         
-        if not self.mcp_tools:
+        if not self._mcp_client:
             return "MCP工具不可用"
         
         # 简化示例：这里应实现MCP工具选择和调用逻辑
         # 实际应用中需要根据查询内容选择合适的MCP工具
         try:
             # 假设我们有一个名为"medical_calculator"的MCP工具
-            calculator_tool = next(
-                (tool for tool in self.mcp_tools if tool.name == "medical_calculator"),
-                None
-            )
-            
-            if calculator_tool:
-                return calculator_tool(query)
+            if self._calculator_tool:
+                return self._calculator_tool(query)
             else:
                 return "未找到合适的MCP工具"
         except Exception as e:
             self.logger.error(f"MCP工具调用失败: {e}")
-            return f"MCP错误: {str(e)}"
\ No newline at end of file
+            return f"MCP错误: {str(e)}"
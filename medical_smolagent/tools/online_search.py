@@ -1,9 +1,21 @@
+import threading
+from cachetools import TTLCache
 from medical_smolagent.tools.base_tool import NetworkTool
 from loguru import logger
-from typing import Optional, Dict, Any
-import json
+from json import JSONDecodeError
 import requests
 
+try:
+    import ijson
+except ImportError:  # 未安装 ijson 时整体解析响应
+    ijson = None
+
+# 解析维基百科响应时可能出现的JSON错误
+_JSON_ERRORS = (JSONDecodeError,) + ((ijson.JSONError,) if ijson is not None else ())
+
+# TextExtracts 在 exintro 模式下单次最多返回20个页面的简介
+_MAX_EXTRACT_PAGES = 20
+
 class WikipediaSearchTool(NetworkTool):
     """维基百科搜索工具，用于获取医疗领域的权威信息"""
     
@@ -35,55 +47,23 @@ class WikipediaSearchTool(NetworkTool):
             }
         }
         self.output_type = "string"
-    
-    def _get_page_content(self, page_id: int, language: str = "en") -> Optional[Dict[str, Any]]:
-        """
-        获取维基百科页面内容
         
-        Args:
-            page_id: 维基百科页面ID
-            language: 语言代码
-            
-        Returns:
-            Optional[Dict[str, Any]]: 包含页面信息的字典，如果获取失败则返回None
-        """
-        try:
-            params = {
-                "action": "query",
-                "prop": "extracts|info",
-                "exintro": True,
-                "explaintext": True,
-                "inprop": "url",
-                "pageids": page_id,
-                "format": "json",
-                "redirects": 1
-            }
-            
-            response = self.session.get(
-                f"https://{language}.wikipedia.org/w/api.php",
-                params=params,
-                timeout=15,
-                verify=False
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            if "query" not in data or "pages" not in data["query"]:
-                return None
-                
-            page = data["query"]["pages"].get(str(page_id))
-            if not page:
-                return None
-                
-            return {
-                "title": page.get("title", ""),
-                "extract": page.get("extract", ""),
-                "url": page.get("fullurl", f"https://{language}.wikipedia.org/?curid={page_id}")
-            }
-            
-        except Exception as e:
-            self.logger.error(f"获取维基百科页面内容失败: {str(e)}")
-            return None
+        # 搜索结果缓存：同一问题在多轮对话中反复出现，命中时无需访问网络
+        self._search_cache = TTLCache(maxsize=512, ttl=300)
+        self._cache_lock = threading.Lock()  # forward 可能被多个线程同时调用
+    
+    def _remember(self, key, result: str) -> str:
+        """缓存搜索结果并原样返回"""
+        with self._cache_lock:
+            self._search_cache[key] = result
+        return result
+    
+    def _read_response(self, response) -> dict:
+        """读取响应的顶层字段；安装了 ijson 时直接从响应流构造对象，不缓冲整个响应体"""
+        if ijson is None:
+            return self._parse_json(response)
+        response.raw.decode_content = True  # 由 urllib3 负责 gzip 解压
+        return dict(ijson.kvitems(response.raw, "", use_float=True))
     
     def forward(self, query: str, language: str = "en", max_results: int = 3) -> str:
         """
@@ -100,47 +80,69 @@ class WikipediaSearchTool(NetworkTool):
         
         self.logger.info(f"执行维基百科搜索: {query}, 语言: {language}, 最大结果数: {max_results}")
         
+        cache_key = (language, query, max_results)
+        with self._cache_lock:
+            cached = self._search_cache.get(cache_key)
+        if cached is not None:
+            self.logger.info("命中维基百科搜索缓存")
+            return cached
+        
+        # 超过上限的页面不会带简介，直接限制搜索条数
+        limit = min(max_results, _MAX_EXTRACT_PAGES)
+        
         try:
-            # 1. 搜索页面
+            # 1. 一次请求同时完成搜索并获取各页面的简介
             search_url = f"https://{language}.wikipedia.org/w/api.php"
             params = {
                 "action": "query",
-                "list": "search",
-                "srsearch": query,
+                "generator": "search",
+                "gsrsearch": query,
+                "gsrlimit": limit,
+                "gsrwhat": "text",
+                "gsrinfo": "",  # 不需要 totalhits 等统计信息
+                "gsrprop": "",  # 不需要 snippet/titlesnippet 等高亮片段
+                "prop": "extracts",  # 只取渲染用到的标题和简介
+                "exintro": 1,
+                "explaintext": 1,  # 返回纯文本，无需再清理 searchmatch 等HTML标签
+                "exlimit": limit,
                 "format": "json",
-                "srlimit": max_results,
-                "srinfo": "totalhits",
-                "srprop": "snippet|titlesnippet",
-                "srwhat": "text"
+                "redirects": 1
             }
             
-            response = self.session.get(search_url, params=params, timeout=10, verify=False)
-            response.raise_for_status()
-            search_results = response.json()
+            # 流式读取时响应不会自动释放，用 with 确保出错时也归还连接
+            with self.session.get(
+                search_url,
+                params=params,
+                timeout=15,
+                verify=self.session.verify,
+                stream=ijson is not None
+            ) as response:
+                response.raise_for_status()
+                data = self._read_response(response)
+            
+            # API级错误（如 maxlag）也返回HTTP 200，不能当作“无结果”缓存；
+            # 没有任何结果时响应中只有 batchcomplete，没有 query
+            if "error" in data or ("query" not in data and "batchcomplete" not in data):
+                error = data.get("error") or {}
+                error_msg = f"维基百科API返回错误: {error.get('code', 'unknown')} - {error.get('info', '响应缺少查询结果')}"
+                self.logger.error(error_msg)
+                return error_msg
             
             # 2. 处理搜索结果
-            if not search_results.get("query", {}).get("search"):
-                return "未找到相关结果"
+            pages = data.get("query", {}).get("pages") or {}
+            # 跳过没有简介的页面（如消歧义页），避免只输出标题
+            pages_with_extract = [page for page in pages.values() if page.get("extract", "").strip()]
+            if not pages_with_extract:
+                return self._remember(cache_key, "未找到相关结果")
                 
             results = []
-            search_data = search_results["query"]["search"]
+            # generator 返回的页面是无序的，按搜索排名（index）排序
+            search_data = sorted(pages_with_extract, key=lambda page: page.get("index", 0))[:limit]
             
-            for i, item in enumerate(search_data[:max_results], 1):
-                title = item.get("title", "")
-                snippet = item.get("snippet", "").replace("<span class=\"searchmatch\">", "").replace("</span>", "")
-                page_id = item.get("pageid")
-                
-                # 3. 获取页面内容
-                if page_id:
-                    page_content = self._get_page_content(page_id, language)
-                    if page_content and "extract" in page_content:
-                        extract = page_content["extract"]
-                        if extract:
-                            results.append(f"{i}. {title}\n{extract}\n")
-                            continue
-                
-                # 如果没有获取到完整内容，使用摘要
-                results.append(f"{i}. {title}\n{snippet}\n")
+            for i, page in enumerate(search_data, 1):
+                title = page.get("title", "")
+                extract = page.get("extract", "")
+                results.append(f"{i}. {title}\n{extract}")
             
             # 4. 添加来源链接
             if results:
@@ -151,7 +153,8 @@ class WikipediaSearchTool(NetworkTool):
                 "\n💡 提示: 维基百科内容由志愿者编辑，请谨慎评估信息的准确性和时效性。"
             )
             
-            return "\n\n" + "\n\n".join(results)
+            # 开头的空串使结果以空行起始，只需一次拼接
+            return self._remember(cache_key, "\n\n".join(["", *results]))
             
         except requests.exceptions.Timeout:
             error_msg = "维基百科搜索超时，请稍后重试。"
@@ -163,9 +166,13 @@ class WikipediaSearchTool(NetworkTool):
             self.logger.error(f"{error_msg} - URL: {e.request.url if hasattr(e, 'request') else 'N/A'}")
             return error_msg
             
-        except json.JSONDecodeError as e:
+        except _JSON_ERRORS as e:
             error_msg = f"解析维基百科响应失败: {str(e)}"
-            self.logger.error(f"{error_msg} - 响应内容: {response.text[:500] if 'response' in locals() else 'N/A'}")
+            # 流式解析后响应体已被读取，只记录请求地址和内容类型
+            self.logger.error(
+                f"{error_msg} - URL: {response.url if 'response' in locals() else 'N/A'}, "
+                f"Content-Type: {response.headers.get('Content-Type') if 'response' in locals() else 'N/A'}"
+            )
             return error_msg
             
         except Exception as e:
@@ -1,27 +1,153 @@
-from typing import Optional, Dict, Any
-import json
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Dict, List
+import hashlib
+import os
 import re
+import threading
+import time
+import httpx
 from openai import OpenAI
 from loguru import logger
-from medical_smolagent import config
+from medical_smolagent import get_config
 
-class LanguageDetector:
-    """Language detector based on character sets with improved CJK differentiation"""
-    
-    # Common Chinese characters that are not used in Japanese
-    CHINESE_ONLY_CHARS = r'[\u4e00-\u9fff]'
+try:
+    import numpy as np
+except ImportError:  # numpy 不可用时退回正则逐段扫描
+    np = None
+
+# 批量翻译时每段文本前的编号标记，如 <<1>>
+_BATCH_MARKER_RE = re.compile(r'<<(\d+)>>')
+
+# 翻译结果缓存的最大条目数
+_TRANSLATION_CACHE_SIZE = 1024
+
+# 客户端初始化失败后，间隔该秒数再重试，避免每次翻译都重新初始化
+_INIT_RETRY_SECONDS = 60.0
+
+# 单次批量请求最多合并的段落数，避免请求过长被截断
+_BATCH_MAX_ITEMS = 16
+
+# 语言代码 -> 语言名称（config.language_map 的反向映射）
+_CODE_TO_LANGUAGE = {code: name for name, code in get_config().language_map.items()}
+
+# 一次扫描识别各类CJK字符，命中的捕获组编号即字符类别
+_CJK_CLASS_RE = re.compile(
+    r'([\u3040-\u30FF]+)'   # 平假名、片假名
+    r'|([\uAC00-\uD7A3]+)'  # 韩文
+    r'|([\u4E00-\u9FFF]+)'  # 汉字
+    r'|([\u3000-\u303F]+)'  # 日文标点
+)
+_KANA, _HANGUL, _HAN, _CJK_PUNCT = 1, 2, 3, 4
+
+# 字符集检测只看开头一段文本，长文档（如维基百科摘要）的开销有上限
+_DETECT_PREFIX_CHARS = 2048
+
+if np is not None:
+    # 各类别的码点区间下界和跨度，顺序与 _CJK_CLASS_RE 的捕获组一致
+    _CJK_LOWER = np.array([0x3040, 0xAC00, 0x4E00, 0x3000], dtype=np.uint32)
+    _CJK_SPAN = np.array([0x30FF - 0x3040, 0xD7A3 - 0xAC00, 0x9FFF - 0x4E00, 0x303F - 0x3000], dtype=np.uint32)
+
+def _cjk_classes(text: str) -> set:
+    """返回文本中出现的CJK字符类别，出现假名时只返回 {_KANA}"""
+    if text.isascii():
+        return set()
+    if np is not None:
+        codepoints = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype="<u4")
+        # 无符号减法溢出后变成大数，一次比较即可判断是否落在区间内
+        hits = ((codepoints[:, None] - _CJK_LOWER) <= _CJK_SPAN).any(axis=0)
+        if hits[_KANA - 1]:
+            return {_KANA}
+        return {cls for cls, hit in enumerate(hits, 1) if hit}
+    found = set()
+    for match in _CJK_CLASS_RE.finditer(text):
+        if match.lastindex == _KANA:
+            return {_KANA}
+        found.add(match.lastindex)
+    return found
+
+# 中文字符检测
+_ZH_RE = re.compile(r'[\u4e00-\u9fff]')
+
+# 判断文本是否已是目标语言的字符集
+_TARGET_LANGUAGE_RE = {
+    "Chinese": _ZH_RE,
+    "Japanese": re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9faf\u3000-\u303f\uff00-\uff9f]'),
+    "Korean": re.compile(r'[\uac00-\ud7a3]'),
+}
+
+# fastText 只需看开头一段文本即可判断语言
+_LID_PREFIX_CHARS = 256
+
+@lru_cache(maxsize=1)
+def _load_lid_model():
+    """延迟加载fastText语言识别模型，未安装fasttext或模型文件不存在时返回None"""
+    model_path = get_config().lid_model_path
+    try:
+        import fasttext
+    except ImportError:
+        logger.info("fasttext not installed, using character-set language detection")
+        return None
+    if not os.path.exists(model_path):
+        logger.info(f"fastText model {model_path} not found, using character-set language detection")
+        return None
+    try:
+        return fasttext.load_model(model_path)
+    except Exception as e:
+        logger.warning(f"Failed to load fastText model {model_path}: {e}")
+        return None
+
+@lru_cache(maxsize=1024)
+def _detect_with_lid(prefix: str) -> Optional[str]:
+    """用fastText识别语言，无法映射到已支持语言时返回None"""
+    try:
+        labels, _ = _load_lid_model().predict(prefix.replace("\n", " "), k=1)
+    except Exception as e:
+        logger.warning(f"fastText language detection failed: {e}")
+        return None
+    if not labels:
+        return None
+    return _CODE_TO_LANGUAGE.get(labels[0].replace("__label__", ""))
+
+class NoProxyTransport(httpx.HTTPTransport):
+    """自定义的transport，完全绕过系统代理"""
     
-    # Japanese specific characters (Hiragana, Katakana, and some Japanese-specific Kanji)
-    JAPANESE_HIRAGANA = r'[\u3040-\u309F]'  # Hiragana
-    JAPANESE_KATAKANA = r'[\u30A0-\u30FF]'  # Katakana
-    JAPANESE_PUNCTUATION = r'[\u3000-\u303F]'  # Japanese punctuation
-    JAPANESE_KANA = JAPANESE_HIRAGANA + JAPANESE_KATAKANA
+    def handle_request(
+        self,
+        request: httpx.Request,
+    ) -> httpx.Response:
+        # 确保请求头中没有代理相关的设置
+        if 'proxy' in request.headers:
+            del request.headers['proxy']
+        if 'Proxy-Connection' in request.headers:
+            del request.headers['Proxy-Connection']
+        # 确保请求不使用代理
+        request.extensions["proxies"] = {}
+        return super().handle_request(request)
+
+@lru_cache(maxsize=1)
+def _get_http_client() -> httpx.Client:
+    """全局共享的HTTP客户端，所有翻译请求复用同一个连接池和TLS会话"""
+    # 创建自定义的HTTP客户端，确保不使用系统代理
+    transport = NoProxyTransport(
+        verify=False,  # 禁用SSL验证
+        retries=3,  # 重试次数
+        proxy=None,  # 显式禁用代理
+        limits=httpx.Limits(max_keepalive_connections=8, max_connections=16)
+    )
     
-    # Korean characters
-    KOREAN_CHARS = r'[\uAC00-\uD7A3]'
+    # 创建HTTP客户端，确保不继承系统代理设置
+    return httpx.Client(
+        timeout=30.0,
+        transport=transport,
+        trust_env=False  # 不信任环境变量中的代理设置
+    )
+
+class LanguageDetector:
+    """Language detector based on character sets with improved CJK differentiation"""
     
-    @classmethod
-    def detect_language(cls, text: str) -> str:
+    @staticmethod
+    def detect_language(text: str) -> str:
         """
         Detect the language of the given text with improved accuracy for CJK languages.
         
@@ -33,31 +159,28 @@ class LanguageDetector:
         """
         if not text.strip():
             return "English"
-            
-        # Check for Japanese specific characters first
-        has_hiragana = bool(re.search(cls.JAPANESE_HIRAGANA, text))
-        has_katakana = bool(re.search(cls.JAPANESE_KATAKANA, text))
-        has_jp_punctuation = bool(re.search(cls.JAPANESE_PUNCTUATION, text))
+        
+        # Prefer the fastText model when available; results are cached per text prefix
+        if _load_lid_model() is not None:
+            detected = _detect_with_lid(text[:_LID_PREFIX_CHARS])
+            if detected:
+                return detected
+        
+        # Classify all code points of the leading chunk in one vectorized pass
+        found = _cjk_classes(text[:_DETECT_PREFIX_CHARS])
         
         # If text contains Hiragana or Katakana, it's definitely Japanese
-        if has_hiragana or has_katakana:
+        if _KANA in found:
             return "Japanese"
             
         # Check for Korean
-        if re.search(cls.KOREAN_CHARS, text):
+        if _HANGUL in found:
             return "Korean"
             
-        # Check for Chinese characters
-        has_chinese = bool(re.search(cls.CHINESE_ONLY_CHARS, text))
-        
-        # If we have Chinese characters and no Japanese indicators, it's likely Chinese
-        if has_chinese and not (has_hiragana or has_katakana or has_jp_punctuation):
-            # Additional check for Japanese punctuation which might indicate Japanese text
-            return "Chinese"
-            
-        # If we have Chinese characters but also Japanese punctuation, it might be Japanese
-        if has_chinese and has_jp_punctuation:
-            return "Japanese"
+        # Chinese characters alongside Japanese punctuation suggest Japanese,
+        # otherwise it's likely Chinese
+        if _HAN in found:
+            return "Japanese" if _CJK_PUNCT in found else "Chinese"
             
         # Default to English for other cases
         return "English"
@@ -69,52 +192,25 @@ class TranslationTool:
         self.logger = logger
         self.client = None
         self.initialized = False
+        self._init_retry_at = 0.0  # 初始化失败后，在此时间（time.monotonic）之前不再重试
+        # 翻译结果的LRU缓存，相同文本重复出现时不再调用API
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
         
     def initialize(self):
         """Initialize the translation client"""
-        if self.initialized:
+        if self.initialized or time.monotonic() < self._init_retry_at:
             return
             
+        config = get_config()
         try:
             if config.translation_api == "qwen" and config.dashscope_api_key:
                 try:
-                    import httpx
-                    import os
-                    
-                    # 创建自定义的transport，完全绕过系统代理
-                    class NoProxyTransport(httpx.HTTPTransport):
-                        def handle_request(
-                            self,
-                            request: httpx.Request,
-                        ) -> httpx.Response:
-                            # 确保请求头中没有代理相关的设置
-                            if 'proxy' in request.headers:
-                                del request.headers['proxy']
-                            if 'Proxy-Connection' in request.headers:
-                                del request.headers['Proxy-Connection']
-                            # 确保请求不使用代理
-                            request.extensions["proxies"] = {}
-                            return super().handle_request(request)
-                    
-                    # 创建自定义的HTTP客户端，确保不使用系统代理
-                    transport = NoProxyTransport(
-                        verify=False,  # 禁用SSL验证
-                        retries=3,  # 重试次数
-                        proxy=None  # 显式禁用代理
-                    )
-                    
-                    # 创建HTTP客户端，确保不继承系统代理设置
-                    http_client = httpx.Client(
-                        timeout=30.0,
-                        transport=transport,
-                        trust_env=False  # 不信任环境变量中的代理设置
-                    )
-                    
                     # 初始化OpenAI客户端
                     self.client = OpenAI(
                         api_key=config.dashscope_api_key,
                         base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-                        http_client=http_client
+                        http_client=_get_http_client()
                     )
                     self.initialized = True
                     self.logger.info("Initialized Qwen MT translation client with direct connection (no proxy)")
@@ -125,6 +221,8 @@ class TranslationTool:
                 self.logger.warning("Qwen MT API key not configured, translation may not work")
         except Exception as e:
             self.logger.error(f"Failed to initialize translation client: {e}")
+        if not self.initialized:
+            self._init_retry_at = time.monotonic() + _INIT_RETRY_SECONDS
     
     def translate(
         self, 
@@ -145,15 +243,16 @@ class TranslationTool:
         Returns:
             翻译后的文本
         """
-        if not text.strip():
+        # 空文本或纯ASCII文本译为英文时无需处理
+        if not text.strip() or (target_lang == "English" and text.isascii()):
             return text
-            
-        self.initialize()
         
         # 如果已经是目标语言，直接返回
         if source_lang == target_lang or (not source_lang and self._is_target_language(text, target_lang)):
             return text
         
+        self.initialize()
+        
         # 如果没有初始化客户端，返回原始文本
         if not self.initialized or not self.client:
             self.logger.warning("Translation client not initialized, returning original text")
@@ -165,87 +264,188 @@ class TranslationTool:
                 source_lang = LanguageDetector.detect_language(text)
                 self.logger.info(f"Detected source language: {source_lang}")
             
-            # 准备翻译选项
-            translation_options = {
-                "source_lang": source_lang,
-                "target_lang": target_lang,
-                "terms": [{"source": k, "target": v} for k, v in (terms or {}).items()]
+            return self._request_translation(text, source_lang, target_lang, terms)
+            
+        except Exception as e:
+            error_msg = f"Translation failed: {str(e)}"
+            self.logger.error(error_msg, exc_info=True)
+            # 返回原始文本而不是抛出异常，确保应用程序继续运行
+            return f"{text}\n\n({error_msg})"
+    
+    def _request_translation(
+        self,
+        text: str,
+        source_lang: str,
+        target_lang: str,
+        terms: Optional[Dict[str, str]]
+    ) -> str:
+        """调用翻译API（带结果缓存），调用失败时抛出异常；调用方需确保客户端已初始化"""
+        cache_key = (
+            hashlib.blake2b(text.encode(), digest_size=16).digest(),
+            source_lang,
+            target_lang,
+            frozenset((terms or {}).items())
+        )
+        with self._cache_lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+        if cached is not None:
+            self.logger.debug("Translation cache hit")
+            return cached
+        
+        # 准备翻译选项
+        translation_options = {
+            "source_lang": source_lang,
+            "target_lang": target_lang,
+            "terms": [{"source": k, "target": v} for k, v in (terms or {}).items()]
+        }
+        
+        # 调用翻译API
+        messages = [{"role": "user", "content": text}]
+        
+        try:
+            self.logger.info(f"Sending translation request to DashScope: {text[:100]}...")
+            
+            # 打印请求详情以便调试
+            request_data = {
+                "model": "qwen-mt-turbo",
+                "messages": messages,
+                "extra_body": {"translation_options": translation_options}
             }
+            self.logger.debug(f"Request data: {request_data}")
             
-            # 调用翻译API
-            messages = [{"role": "user", "content": text}]
+            # 发送请求
+            response = self.client.chat.completions.create(
+                model="qwen-mt-turbo",
+                messages=messages,
+                extra_body={"translation_options": translation_options},
+                timeout=30.0
+            )
             
-            try:
-                self.logger.info(f"Sending translation request to DashScope: {text[:100]}...")
-                
-                # 打印请求详情以便调试
-                request_data = {
-                    "model": "qwen-mt-turbo",
-                    "messages": messages,
-                    "extra_body": {"translation_options": translation_options}
-                }
-                self.logger.debug(f"Request data: {request_data}")
-                
-                # 发送请求
-                response = self.client.chat.completions.create(
-                    model="qwen-mt-turbo",
-                    messages=messages,
-                    extra_body={"translation_options": translation_options},
-                    timeout=30.0
-                )
-                
-                self.logger.debug(f"Raw API response: {response}")
-                
-                if not response.choices or not response.choices[0].message:
-                    error_msg = "Empty or invalid response from translation API"
-                    self.logger.error(error_msg)
-                    raise ValueError(error_msg)
-                    
-                translated_text = response.choices[0].message.content
-                
-                if not translated_text or translated_text.strip() == text.strip():
-                    self.logger.warning("Translation returned the same text as input")
-                
-                self.logger.info(f"Successfully translated from {source_lang} to {target_lang}")
-                self.logger.debug(f"Translation result: {text[:50]}... -> {translated_text[:50]}...")
-                
-                return translated_text
-                
-            except Exception as e:
-                error_msg = f"Translation API call failed: {str(e)}"
-                self.logger.error(error_msg, exc_info=True)  # 记录完整的堆栈跟踪
-                self.logger.error(f"Request details - Text: {text}, Source: {source_lang}, Target: {target_lang}")
-                
-                # 尝试获取更多错误信息
-                if hasattr(e, 'response'):
-                    try:
-                        if hasattr(e.response, 'text'):
-                            self.logger.error(f"API Error Response: {e.response.text}")
-                        if hasattr(e.response, 'status_code'):
-                            self.logger.error(f"API Status Code: {e.response.status_code}")
-                        if hasattr(e.response, 'headers'):
-                            self.logger.error(f"API Response Headers: {dict(e.response.headers)}")
-                    except Exception as inner_e:
-                        self.logger.error(f"Error while extracting error details: {str(inner_e)}")
+            self.logger.debug(f"Raw API response: {response}")
+            
+            if not response.choices or not response.choices[0].message:
+                error_msg = "Empty or invalid response from translation API"
+                self.logger.error(error_msg)
+                raise ValueError(error_msg)
                 
-                # 返回原始文本而不是抛出异常，确保应用程序继续运行
-                return f"{text}\n\n(Translation failed: {error_msg})"
+            translated_text = response.choices[0].message.content
             
         except Exception as e:
+            self.logger.error(f"Translation API call failed: {str(e)}")
+            self.logger.error(f"Request details - Text: {text}, Source: {source_lang}, Target: {target_lang}")
+            
+            # 尝试获取更多错误信息
+            if hasattr(e, 'response'):
+                try:
+                    if hasattr(e.response, 'text'):
+                        self.logger.error(f"API Error Response: {e.response.text}")
+                    if hasattr(e.response, 'status_code'):
+                        self.logger.error(f"API Status Code: {e.response.status_code}")
+                    if hasattr(e.response, 'headers'):
+                        self.logger.error(f"API Response Headers: {dict(e.response.headers)}")
+                except Exception as inner_e:
+                    self.logger.error(f"Error while extracting error details: {str(inner_e)}")
+            raise
+        
+        if not translated_text or translated_text.strip() == text.strip():
+            self.logger.warning("Translation returned the same text as input")
+        
+        self.logger.info(f"Successfully translated from {source_lang} to {target_lang}")
+        self.logger.debug(f"Translation result: {text[:50]}... -> {(translated_text or '')[:50]}...")
+        
+        if translated_text:
+            with self._cache_lock:
+                self._cache[cache_key] = translated_text
+                if len(self._cache) > _TRANSLATION_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        
+        return translated_text
+    
+    def translate_batch(
+        self,
+        texts: List[str],
+        source_lang: Optional[str] = None,
+        target_lang: str = "Chinese",
+        terms: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """
+        批量翻译多段文本，同一源语言的段落合并为尽量少的API请求
+        
+        Args:
+            texts: 要翻译的文本列表
+            source_lang: 源语言，如果为None则自动检测
+            target_lang: 目标语言，默认为中文
+            terms: 术语表，用于特定术语的精确翻译
+            
+        Returns:
+            与输入顺序一致的翻译结果列表
+        """
+        results = list(texts)
+        
+        # 只翻译非空且不是目标语言的段落
+        pending = [
+            i for i, text in enumerate(texts)
+            if text.strip() and source_lang != target_lang
+            and (source_lang or not self._is_target_language(text, target_lang))
+        ]
+        if not pending:
+            return results
+        
+        # 按源语言分组，每组再按 _BATCH_MAX_ITEMS 分块，每块一次请求
+        if source_lang:
+            groups = {source_lang: pending}
+        else:
+            groups = {}
+            for i in pending:
+                groups.setdefault(LanguageDetector.detect_language(texts[i]), []).append(i)
+        
+        for lang, indices in groups.items():
+            for start in range(0, len(indices), _BATCH_MAX_ITEMS):
+                chunk = indices[start:start + _BATCH_MAX_ITEMS]
+                translated = self._translate_chunk([texts[i] for i in chunk], lang, target_lang, terms)
+                for i, text in zip(chunk, translated):
+                    results[i] = text
+        return results
+    
+    def _translate_chunk(
+        self,
+        texts: List[str],
+        source_lang: str,
+        target_lang: str,
+        terms: Optional[Dict[str, str]]
+    ) -> List[str]:
+        """用编号标记拼接同一源语言的若干段落，一次请求翻译全部内容"""
+        if len(texts) == 1:
+            return [self.translate(texts[0], source_lang, target_lang, terms)]
+        
+        self.initialize()
+        if not self.initialized or not self.client:
+            self.logger.warning("Translation client not initialized, returning original text")
+            return list(texts)
+        
+        payload = "\n".join(f"<<{n}>> {text}" for n, text in enumerate(texts, 1))
+        try:
+            translated = self._request_translation(payload, source_lang, target_lang, terms)
+        except Exception as e:
+            # 整块请求失败时不再逐段重试，每段各自附带错误说明
             error_msg = f"Translation failed: {str(e)}"
-            self.logger.error(error_msg, exc_info=True)
-            return f"{text}\n\n({error_msg})"
+            return [f"{text}\n\n({error_msg})" for text in texts]
+        
+        # 每段必须恰好对应一个编号且按顺序出现，否则（段落本身含标记、漏译、重复）逐段翻译
+        parts = _BATCH_MARKER_RE.split(translated or "")
+        if parts[1::2] != [str(n) for n in range(1, len(texts) + 1)]:
+            self.logger.warning("Batch translation response could not be split, falling back to per-item translation")
+            return [self.translate(text, source_lang, target_lang, terms) for text in texts]
+        
+        return [part.strip() for part in parts[2::2]]
     
     def _is_target_language(self, text: str, target_lang: str) -> bool:
         """Check if text is in the target language"""
-        if target_lang == "Chinese":
-            return bool(re.search(r'[\u4e00-\u9fff]', text))
-        elif target_lang == "Japanese":
-            return bool(re.search(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9faf\u3000-\u303f\uff00-\uff9f]', text))
-        elif target_lang == "Korean":
-            return bool(re.search(r'[\uac00-\ud7a3]', text))
+        pattern = _TARGET_LANGUAGE_RE.get(target_lang)
         # For other languages, we can't reliably detect, so assume it's not the target
-        return False
+        return bool(pattern and pattern.search(text))
 
 # 创建全局翻译器实例
 translator = TranslationTool()
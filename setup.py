@@ -11,5 +11,6 @@ setup(
         'loguru',
         'pydantic',
         'requests',
+        'cachetools',
     ],
 )    
\ No newline at end of file
@@ -4,7 +4,16 @@ import aiohttp
 async def test_connection():
     url = "https://evalstate-hf-mcp-server.hf.space/mcp"
     try:
-        async with aiohttp.ClientSession() as session:
+        # 复用连接并缓存DNS解析结果，重复运行时省去建连开销
+        connector = aiohttp.TCPConnector(
+            ssl=False,
+            limit=16,
+            limit_per_host=8,
+            ttl_dns_cache=300,
+            use_dns_cache=True,
+            keepalive_timeout=30
+        )
+        async with aiohttp.ClientSession(connector=connector) as session:
             async with session.get(url, timeout=10) as response:
                 print(f"Status: {response.status}")
                 print(f"Response: {await response.text()}")
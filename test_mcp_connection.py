@@ -2,6 +2,7 @@ import asyncio
 import aiohttp
 import time
 import os
+from typing import Optional
 from smolagents import ToolCollection
 
 # 设置代理
@@ -14,8 +15,23 @@ SERVER_URL = "https://evalstate-hf-mcp-server.hf.space/mcp"
 # 代理设置
 PROXY = 'http://127.0.0.1:7890'
 
-async def test_connection():
-    """测试 MCP 服务器连接"""
+def make_connector() -> aiohttp.TCPConnector:
+    """创建复用连接并缓存DNS解析结果的连接器"""
+    return aiohttp.TCPConnector(
+        ssl=False,
+        limit=16,
+        limit_per_host=8,
+        ttl_dns_cache=300,
+        use_dns_cache=True,
+        keepalive_timeout=30
+    )
+
+async def test_connection(session: Optional[aiohttp.ClientSession] = None):
+    """测试 MCP 服务器连接，未传入会话时自行创建"""
+    if session is None:
+        async with aiohttp.ClientSession(connector=make_connector()) as own_session:
+            return await test_connection(own_session)
+    
     print("\n" + "="*60)
     print("测试 MCP 服务器连接")
     print("="*60)
@@ -23,17 +39,15 @@ async def test_connection():
     start = time.time()
     try:
         # 测试基本连接
-        connector = aiohttp.TCPConnector(ssl=False)
         timeout = aiohttp.ClientTimeout(total=10)
         
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.get(SERVER_URL, 
-                                proxy=PROXY, 
-                                timeout=timeout,
-                                ssl=False) as resp:
-                print(f"✅ 连接成功! 状态码: {resp.status}")
-                print(f"   响应时间: {time.time()-start:.2f}秒")
-                return True
+        async with session.get(SERVER_URL, 
+                            proxy=PROXY, 
+                            timeout=timeout,
+                            ssl=False) as resp:
+            print(f"✅ 连接成功! 状态码: {resp.status}")
+            print(f"   响应时间: {time.time()-start:.2f}秒")
+            return True
     except Exception as e:
         print(f"❌ 连接失败: {str(e)}")
         print("\n可能的原因:")
@@ -70,9 +84,10 @@ async def test_tools():
         return False
 
 async def main():
-    # 测试连接
-    if not await test_connection():
-        return
+    # 测试连接（整个运行过程共用一个会话）
+    async with aiohttp.ClientSession(connector=make_connector()) as session:
+        if not await test_connection(session):
+            return
     
     # 测试工具加载
     if not await test_tools():